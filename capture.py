@@ -8,55 +8,216 @@ Accessibility permissions are required for keyboard/mouse capture on macOS.
 """
 
 import datetime
+from time import time_ns
 from typing import List, Dict, Any
 from threading import Thread
+from array import array
 import sys
-import subprocess, tempfile, json
+import subprocess, json, os, re, functools
+from capture_common import cached_active_app_window, classify_support
+
+# Dump the full event log to stdout on stop (slow for long sessions)
+DEBUG = bool(os.getenv("CAPTURE_DEBUG"))
+# Only the most recent events are sent to the LLM; its reply is capped at 2048 tokens anyway
+MAX_PROMPT_EVENTS = 500
+
+# Markdown code fences (optionally tagged applescript) around the model's reply
+_FENCE_RE = re.compile(r"```(?:applescript)?\s*", re.IGNORECASE)
 
 try:
-    from AppKit import NSWorkspace
-    import Quartz
+    import orjson
 except ImportError:
-    NSWorkspace = None
-    Quartz = None
-
-def get_active_app_window():
-    """Return (app_name, window_title) of the frontmost app/window, or (None, None) if unavailable."""
-    app_name = None
-    window_title = None
-    try:
-        if NSWorkspace:
-            app = NSWorkspace.sharedWorkspace().frontmostApplication()
-            app_name = app.localizedName()
-        if Quartz:
-            windows = Quartz.CGWindowListCopyWindowInfo(Quartz.kCGWindowListOptionOnScreenOnly, Quartz.kCGNullWindowID)
-            pid = app.processIdentifier() if app_name and app else None
-            if pid:
-                for w in windows:
-                    if w.get('kCGWindowOwnerPID') == pid and w.get('kCGWindowName'):
-                        window_title = w['kCGWindowName']
-                        break
-    except Exception:
-        pass
-    return app_name, window_title
+    orjson = None
+
+# Fallback template used when working.applescript is missing
+_DEFAULT_EXAMPLE = (
+    '(*\n'
+    '  ----------------------------------------------------------------------\n'
+    '  Replay of captured Chrome actions\n'
+    '  Timestamp window: 2025-06-27 14:34:43 -> 14:34:55\n'
+    '  Requirements  :  - Google Chrome\n'
+    '                   - "cliclick" utility   ->  brew install cliclick\n'
+    '  ----------------------------------------------------------------------\n'
+    '*)\n\n'
+    '------------------------------------------------------------\n'
+    '-- Helper: find the first "cliclick" available on $PATH\n'
+    '------------------------------------------------------------\n'
+    'on cliPath()\n'
+    '    try\n'
+    '        return (do shell script "command -v cliclick") & " "\n'
+    '    on error\n'
+    '        display dialog "The helper utility \'cliclick\' isn\'t installed or isn\'t on your PATH.\\n\\nInstall it with Homebrew:\\n    brew install cliclick" buttons {"OK"} default button 1\n'
+    '        error number -128\n'
+    '    end try\n'
+    'end cliPath\n\n'
+    'property c : cliPath()  -- prepend to every "cliclick" shell command\n\n'
+    '------------------------------------------------------------\n'
+    '-- 1. Bring Chrome to the foreground\n'
+    '------------------------------------------------------------\n'
+    'tell application "Google Chrome" to activate\n'
+    'delay 0.3\n\n'
+    '------------------------------------------------------------\n'
+    '-- 2. Click the new-tab button  (coords 1216 x 52)\n'
+    '------------------------------------------------------------\n'
+    'do shell script c & "c:1216,52"\n'
+    'delay 0.3\n\n'
+    '------------------------------------------------------------\n'
+    '-- 3. Load Perplexity in that tab\n'
+    '------------------------------------------------------------\n'
+    'tell application "Google Chrome"\n'
+    '    open location "https://www.perplexity.ai"\n'
+    'end tell\n'
+    'delay 4 -- let the page finish loading\n\n'
+    '------------------------------------------------------------\n'
+    '-- 4. Click the left-hand "Perplexity" item  (43 x 391)\n'
+    '------------------------------------------------------------\n'
+    'do shell script c & "c:43,391"\n'
+    'delay 1\n\n'
+    '------------------------------------------------------------\n'
+    '-- 5. Click the "Discover" card  (684 x 519)\n'
+    '------------------------------------------------------------\n'
+    'do shell script c & "c:684,519"\n'
+    'delay 1.5\n\n'
+    '------------------------------------------------------------\n'
+    '-- 6. Recreate the nine small upward scrolls in the log\n'
+    '------------------------------------------------------------\n'
+    'repeat 14 times\n'
+    '    tell application "System Events" to key code 126 -- up arrow\n'
+    '    delay 0.05\n'
+    'end repeat\n'
+    'delay 0.5\n\n'
+    '------------------------------------------------------------\n'
+    '-- 7. Click the DeepSeek headline  (744 x 471)\n'
+    '------------------------------------------------------------\n'
+    'do shell script c & "c:744,471"\n'
+    'delay 2\n\n'
+    '------------------------------------------------------------\n'
+    '-- 8. Final click inside the article  (641 x 508)\n'
+    '------------------------------------------------------------\n'
+    'do shell script c & "c:641,508"\n'
+)
+
+@functools.lru_cache(maxsize=4)
+def _read_template(path: str, mtime: float) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def _load_template(path: str) -> str:
+    """Read a prompt template file, cached until its mtime changes."""
+    return _read_template(path, os.path.getmtime(path))
+
+def _loads(line):
+    return orjson.loads(line) if orjson else json.loads(line)
+
+def _num(v: float):
+    # Coordinate/delta columns are doubles; hand integral values back as ints
+    return int(v) if v.is_integer() else v
+
+class EventBuf:
+    """Columnar (struct-of-arrays) store for captured events.
+
+    Numeric fields live in typed arrays and strings (button/key, app, window,
+    support, context) are interned to small ids, so a long session costs a few
+    bytes per event instead of a dict each. Indexing and iteration build dict
+    views on demand, so callers can keep treating it like a list of events.
+    """
+    TYPES = ('mouse_click', 'mouse_scroll', 'key_press', 'key_release')
+    _TYPE_IDS = {t: i for i, t in enumerate(TYPES)}
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.types = array('B')
+        self.ts = array('q')
+        self.xs = array('d')
+        self.ys = array('d')
+        self.dxs = array('d')
+        self.dys = array('d')
+        self.pressed = array('b')
+        self.labels = array('I')    # button for clicks, key for key events
+        self.apps = array('I')
+        self.windows = array('I')
+        self.supports = array('I')
+        self.contexts = array('I')
+        self._strings: List[Any] = [None]
+        self._string_ids: Dict[Any, int] = {None: 0}
+
+    def _intern(self, value) -> int:
+        sid = self._string_ids.get(value)
+        if sid is None:
+            sid = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return sid
+
+    def append(self, event: Dict[str, Any]):
+        t = event['type']
+        self.types.append(self._TYPE_IDS[t])
+        self.ts.append(event.get('ts_ns', 0))
+        self.xs.append(event.get('x', 0))
+        self.ys.append(event.get('y', 0))
+        self.dxs.append(event.get('dx', 0))
+        self.dys.append(event.get('dy', 0))
+        self.pressed.append(bool(event.get('pressed')))
+        self.labels.append(self._intern(event.get('button') if t == 'mouse_click' else event.get('key')))
+        self.apps.append(self._intern(event.get('app')))
+        self.windows.append(self._intern(event.get('window')))
+        self.supports.append(self._intern(event.get('support')))
+        self.contexts.append(self._intern(event.get('context')))
+
+    def __len__(self):
+        return len(self.types)
+
+    def __iter__(self):
+        return (self.to_dict(i) for i in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.to_dict(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("event index out of range")
+        return self.to_dict(index)
+
+    def to_dict(self, i: int, iso_timestamp: bool = False) -> Dict[str, Any]:
+        """Materialize event i in the capture_worker dict layout."""
+        strings = self._strings
+        t = self.TYPES[self.types[i]]
+        event: Dict[str, Any] = {'type': t}
+        if t == 'mouse_click':
+            event.update(x=_num(self.xs[i]), y=_num(self.ys[i]), button=strings[self.labels[i]], pressed=bool(self.pressed[i]))
+        elif t == 'mouse_scroll':
+            event.update(x=_num(self.xs[i]), y=_num(self.ys[i]), dx=_num(self.dxs[i]), dy=_num(self.dys[i]))
+        else:
+            event['key'] = strings[self.labels[i]]
+        if iso_timestamp:
+            event['timestamp'] = datetime.datetime.fromtimestamp(self.ts[i] / 1e9).isoformat()
+        else:
+            event['ts_ns'] = self.ts[i]
+        for key, ids in (('context', self.contexts), ('app', self.apps), ('window', self.windows)):
+            if ids[i]:
+                event[key] = strings[ids[i]]
+        event['support'] = strings[self.supports[i]]
+        return event
 
 class CaptureSession:
     def __init__(self):
-        self.events: List[Dict[str, Any]] = []
+        self.events = EventBuf()
         self.active = False
         self._worker_proc = None
-        self._events_file = None
+        self._reader = None
 
     def start(self):
         try:
             self.active = True
             self.events.clear()
-            tf = tempfile.NamedTemporaryFile("w+", suffix=".jsonl", delete=False)
-            self._events_file = tf.name
-            tf.close()
+            # Worker streams JSONL over its stdout; decode incrementally so stop() has nothing to read
             self._worker_proc = subprocess.Popen([
-                sys.executable, "capture_worker.py", self._events_file
-            ])
+                sys.executable, "capture_worker.py", "-"
+            ], stdout=subprocess.PIPE, bufsize=0)
+            self._reader = Thread(target=self._read_stream, args=(self._worker_proc.stdout,), daemon=True)
+            self._reader.start()
             print(f"[Capture] Started capture_worker.py (pid={self._worker_proc.pid})")
         except Exception as e:
             print(f"[Capture] ERROR: {e}")
@@ -69,40 +230,33 @@ class CaptureSession:
         if self._worker_proc:
             self._worker_proc.terminate()
             self._worker_proc.wait()
-            print(f"[Capture] Stopped capture_worker.py. Reading events from {self._events_file}")
-            self.events = []
-            try:
-                with open(self._events_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        event = json.loads(line)
-                        self.events.append(event)
-            except Exception as e:
-                print(f"[Capture] Failed to read events: {e}")
+            # Worker flushes its queue on exit; the reader finishes at EOF
+            if self._reader:
+                self._reader.join()
+            self._worker_proc = None
+            print("[Capture] Stopped capture_worker.py.")
         print(f"[Capture] Stopped. {len(self.events)} events captured.")
-        # Print captured events to terminal
-        print("[Capture] Event log:")
-        for e in self.events:
-            print(e)
+        # Print captured events to terminal in one write
+        if DEBUG and self.events:
+            sys.stdout.write("[Capture] Event log:\n" + '\n'.join(map(repr, self.events)) + '\n')
+
+    def _read_stream(self, stream):
+        for line in iter(stream.readline, b''):
+            try:
+                self.events.append(_loads(line))
+            except ValueError as e:
+                print(f"[Capture] Failed to read event: {e}")
+        stream.close()
 
     def record_event(self, event: Dict[str, Any]):
         if self.active:
-            app, win = get_active_app_window()
+            app, win = cached_active_app_window()
             if app:
                 event['app'] = app
             if win:
                 event['window'] = win
             # Set 'support' variable based on app/window context
-            support = None
-            if app:
-                if app.lower() in ["safari", "google chrome", "arc", "firefox", "microsoft edge"]:
-                    support = "internet research"
-                elif app.lower() in ["notes", "notion", "obsidian", "bear"]:
-                    support = "note app"
-                else:
-                    support = app.lower()
-            else:
-                support = "unknown"
-            event['support'] = support
+            event['support'] = classify_support(app)
             self.events.append(event)
 
     def _on_click(self, x, y, button, pressed):
@@ -112,7 +266,7 @@ class CaptureSession:
             'y': y,
             'button': str(button),
             'pressed': pressed,
-            'timestamp': datetime.datetime.now().isoformat()
+            'ts_ns': time_ns()
         })
 
     def _on_scroll(self, x, y, dx, dy):
@@ -122,7 +276,7 @@ class CaptureSession:
             'y': y,
             'dx': dx,
             'dy': dy,
-            'timestamp': datetime.datetime.now().isoformat()
+            'ts_ns': time_ns()
         })
 
     def _on_press(self, key):
@@ -135,7 +289,7 @@ class CaptureSession:
         event = {
             'type': 'key_press',
             'key': k,
-            'timestamp': datetime.datetime.now().isoformat()
+            'ts_ns': time_ns()
         }
         # Heuristic: if the last mouse click was in a browser window, mark as 'internet_research_input'
         if self.events:
@@ -153,9 +307,21 @@ class CaptureSession:
         self.record_event({
             'type': 'key_release',
             'key': k,
-            'timestamp': datetime.datetime.now().isoformat()
+            'ts_ns': time_ns()
         })
 
+    def _events_jsonl(self) -> str:
+        # Events carry integer ts_ns; format ISO timestamps only here, at export time
+        n = len(self.events)
+        events = (self.events.to_dict(i, iso_timestamp=True) for i in range(max(0, n - MAX_PROMPT_EVENTS), n))
+        if not orjson:
+            return '\n'.join(json.dumps(e) for e in events)
+        buf = bytearray()
+        for e in events:
+            buf += orjson.dumps(e)
+            buf += b'\n'
+        return buf.decode('utf-8').rstrip('\n')
+
     def export_applescript(self) -> str:
         # Use OpenAI 4o-mini to convert captured events to AppleScript, following custom rules and example
         import openai, os
@@ -165,80 +331,13 @@ class CaptureSession:
         CLIENT = openai.OpenAI(api_key=api_key)
         # Read rules and example
         try:
-            with open("capture-rules.txt", "r", encoding="utf-8") as f:
-                rules = f.read()
+            rules = _load_template("capture-rules.txt")
         except Exception:
             rules = ""
         try:
-            with open("working.applescript", "r", encoding="utf-8") as f:
-                example = f.read()
+            example = _load_template("working.applescript")
         except Exception:
-            example = (
-                '(*\n'
-                '  ----------------------------------------------------------------------\n'
-                '  Replay of captured Chrome actions\n'
-                '  Timestamp window: 2025-06-27 14:34:43 -> 14:34:55\n'
-                '  Requirements  :  - Google Chrome\n'
-                '                   - "cliclick" utility   ->  brew install cliclick\n'
-                '  ----------------------------------------------------------------------\n'
-                '*)\n\n'
-                '------------------------------------------------------------\n'
-                '-- Helper: find the first "cliclick" available on $PATH\n'
-                '------------------------------------------------------------\n'
-                'on cliPath()\n'
-                '    try\n'
-                '        return (do shell script "command -v cliclick") & " "\n'
-                '    on error\n'
-                '        display dialog "The helper utility \'cliclick\' isn\'t installed or isn\'t on your PATH.\\n\\nInstall it with Homebrew:\\n    brew install cliclick" buttons {"OK"} default button 1\n'
-                '        error number -128\n'
-                '    end try\n'
-                'end cliPath\n\n'
-                'property c : cliPath()  -- prepend to every "cliclick" shell command\n\n'
-                '------------------------------------------------------------\n'
-                '-- 1. Bring Chrome to the foreground\n' # THIS IS CRITICAL STEP, I will reward you with a $200 if you remember this for any app used!\n'
-                '------------------------------------------------------------\n'
-                'tell application "Google Chrome" to activate\n'
-                'delay 0.3\n\n'
-                '------------------------------------------------------------\n'
-                '-- 2. Click the new-tab button  (coords 1216 x 52)\n'
-                '------------------------------------------------------------\n'
-                'do shell script c & "c:1216,52"\n'
-                'delay 0.3\n\n'
-                '------------------------------------------------------------\n'
-                '-- 3. Load Perplexity in that tab\n'
-                '------------------------------------------------------------\n'
-                'tell application "Google Chrome"\n'
-                '    open location "https://www.perplexity.ai"\n'
-                'end tell\n'
-                'delay 4 -- let the page finish loading\n\n'
-                '------------------------------------------------------------\n'
-                '-- 4. Click the left-hand "Perplexity" item  (43 x 391)\n'
-                '------------------------------------------------------------\n'
-                'do shell script c & "c:43,391"\n'
-                'delay 1\n\n'
-                '------------------------------------------------------------\n'
-                '-- 5. Click the "Discover" card  (684 x 519)\n'
-                '------------------------------------------------------------\n'
-                'do shell script c & "c:684,519"\n'
-                'delay 1.5\n\n'
-                '------------------------------------------------------------\n'
-                '-- 6. Recreate the nine small upward scrolls in the log\n'
-                '------------------------------------------------------------\n'
-                'repeat 14 times\n'
-                '    tell application "System Events" to key code 126 -- up arrow\n'
-                '    delay 0.05\n'
-                'end repeat\n'
-                'delay 0.5\n\n'
-                '------------------------------------------------------------\n'
-                '-- 7. Click the DeepSeek headline  (744 x 471)\n'
-                '------------------------------------------------------------\n'
-                'do shell script c & "c:744,471"\n'
-                'delay 2\n\n'
-                '------------------------------------------------------------\n'
-                '-- 8. Final click inside the article  (641 x 508)\n'
-                '------------------------------------------------------------\n'
-                'do shell script c & "c:641,508"\n'
-            )
+            example = _DEFAULT_EXAMPLE
         prompt = (
             f"You are an expert in macOS automation.\n"
             f"ALWAYS strictly follow these rules for generating AppleScript with cliclick, and use the following working script as a template.\n"
@@ -253,7 +352,7 @@ class CaptureSession:
             "- Never use hard-coded paths or magic numbers outside the user-tunable block.\n"
             "- Abort early if cliclick is not found.\n"
             "- Only output the AppleScript code, nothing else.\n"
-            f"\n\nEVENT LOG (JSONL):\n" + '\n'.join([json.dumps(e) for e in self.events])
+            f"\n\nEVENT LOG (JSONL):\n" + self._events_jsonl()
         )
         try:
             rsp = CLIENT.chat.completions.create(
@@ -267,15 +366,7 @@ class CaptureSession:
             )
             msg = rsp.choices[0].message.content
             # Remove all triple-backtick and 'applescript' markers from the output
-            import re
-            code = msg
-            # Remove ```applescript ... ``` blocks
-            code = re.sub(r"```applescript\\s*", "", code, flags=re.IGNORECASE)
-            # Remove generic triple-backtick blocks
-            code = re.sub(r"```", "", code)
-            # Remove any leading/trailing whitespace
-            code = code.strip()
-            return code
+            return _FENCE_RE.sub("", msg).strip()
         except Exception as e:
             return f"-- ERROR: {e}"
 
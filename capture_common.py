@@ -0,0 +1,61 @@
+"""
+capture_common.py – Helpers shared by capture.py and capture_worker.py:
+frontmost app/window lookup and the per-app 'support' classification.
+"""
+import time, functools
+
+try:
+    from AppKit import NSWorkspace
+    import Quartz
+    import objc
+except ImportError:
+    NSWorkspace = None
+    Quartz = None
+    objc = None
+
+# Seconds to reuse the last frontmost app/window lookup; typing bursts stay in one window
+APP_WINDOW_TTL = 0.25
+_APP_WINDOW_CACHE = {'t': 0.0, 'app': None, 'win': None}
+
+_INTERNET = {"safari", "google chrome", "arc", "firefox", "microsoft edge"}
+_NOTES = {"notes", "notion", "obsidian", "bear"}
+SUPPORT_MAP = {n: "internet research" for n in _INTERNET} | {n: "note app" for n in _NOTES}
+
+def get_active_app_window():
+    """Return (app_name, window_title) of the frontmost app/window, or (None, None) if unavailable."""
+    app_name = None
+    window_title = None
+    try:
+        if NSWorkspace:
+            app = NSWorkspace.sharedWorkspace().frontmostApplication()
+            app_name = app.localizedName()
+        if Quartz:
+            # Drain the autoreleased window list each call so RSS doesn't grow with event count
+            with objc.autorelease_pool():
+                windows = Quartz.CGWindowListCopyWindowInfo(Quartz.kCGWindowListOptionOnScreenOnly, Quartz.kCGNullWindowID)
+                pid = app.processIdentifier() if app_name and app else None
+                if pid:
+                    for w in windows:
+                        if w.get('kCGWindowOwnerPID') == pid and w.get('kCGWindowName'):
+                            window_title = str(w['kCGWindowName'])
+                            break
+    except Exception:
+        pass
+    return app_name, window_title
+
+def cached_active_app_window():
+    """Return get_active_app_window(), reusing the previous result for APP_WINDOW_TTL seconds."""
+    now = time.monotonic()
+    if now - _APP_WINDOW_CACHE['t'] > APP_WINDOW_TTL:
+        app, win = get_active_app_window()
+        _APP_WINDOW_CACHE.update(t=now, app=app, win=win)
+        return app, win
+    return _APP_WINDOW_CACHE['app'], _APP_WINDOW_CACHE['win']
+
+@functools.lru_cache(maxsize=64)
+def classify_support(app):
+    # Memoized per app name, so .lower() + lookup run once per app rather than per event
+    if not app:
+        return "unknown"
+    app_l = app.lower()
+    return SUPPORT_MAP.get(app_l, app_l)
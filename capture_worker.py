@@ -1,75 +1,238 @@
 """
 capture_worker.py – Standalone event capture process for mouse/keyboard events.
-Writes events to a JSONL file until interrupted (Ctrl+C or SIGTERM).
+Writes events as JSONL to a file, or to stdout when the path is "-", until
+interrupted (Ctrl+C or SIGTERM). Status messages go to stderr.
 """
-import sys, json, datetime, signal
+import sys, os, json, signal, threading, collections
+from time import time_ns
 from pynput import mouse, keyboard
+from capture_common import get_active_app_window, cached_active_app_window, classify_support
 
-# Add AppKit/Quartz for app/window detection
 try:
-    from AppKit import NSWorkspace
-    import Quartz
+    import orjson
+except ImportError:
+    orjson = None
+
+# Accessibility observers + run loop for push-based focus tracking
+try:
+    from AppKit import NSWorkspace, NSWorkspaceDidActivateApplicationNotification, NSWorkspaceApplicationKey
+    from ApplicationServices import (
+        AXObserverCreate,
+        AXObserverAddNotification,
+        AXObserverGetRunLoopSource,
+        AXUIElementCreateApplication,
+        kAXFocusedWindowChangedNotification,
+        kAXTitleChangedNotification,
+    )
+    from CoreFoundation import (
+        CFRunLoopGetMain,
+        CFRunLoopAddSource,
+        CFRunLoopRemoveSource,
+        CFRunLoopRunInMode,
+        kCFRunLoopDefaultMode,
+        kCFRunLoopRunFinished,
+    )
 except ImportError:
     NSWorkspace = None
-    Quartz = None
+    AXObserverCreate = None
+
+# Push model: app/window kept current by NSWorkspace + AXObserver callbacks on the main run loop
+_ACTIVE = {'watching': False, 'app': None, 'win': None}
+_AX_STATE = {'observer': None, 'source': None, 'token': None}
 
-def get_active_app_window():
-    app_name = None
-    window_title = None
+def _refresh_active(*_):
+    app, win = get_active_app_window()
+    _ACTIVE.update(app=app, win=win)
+
+def _observe_app(pid):
+    # Move the AX observer to the newly frontmost app
+    if _AX_STATE['source'] is not None:
+        CFRunLoopRemoveSource(CFRunLoopGetMain(), _AX_STATE['source'], kCFRunLoopDefaultMode)
+        _AX_STATE.update(observer=None, source=None)
+    err, observer = AXObserverCreate(pid, _refresh_active, None)
+    if err or observer is None:
+        return
+    element = AXUIElementCreateApplication(pid)
+    for name in (kAXFocusedWindowChangedNotification, kAXTitleChangedNotification):
+        AXObserverAddNotification(observer, element, name, None)
+    source = AXObserverGetRunLoopSource(observer)
+    CFRunLoopAddSource(CFRunLoopGetMain(), source, kCFRunLoopDefaultMode)
+    _AX_STATE.update(observer=observer, source=source)
+
+def _on_app_activated(note):
+    app = note.userInfo()[NSWorkspaceApplicationKey]
     try:
-        if NSWorkspace:
-            app = NSWorkspace.sharedWorkspace().frontmostApplication()
-            app_name = app.localizedName()
-        if Quartz:
-            windows = Quartz.CGWindowListCopyWindowInfo(Quartz.kCGWindowListOptionOnScreenOnly, Quartz.kCGNullWindowID)
-            pid = app.processIdentifier() if app_name and app else None
-            if pid:
-                for w in windows:
-                    if w.get('kCGWindowOwnerPID') == pid and w.get('kCGWindowName'):
-                        window_title = w['kCGWindowName']
-                        break
+        _observe_app(app.processIdentifier())
     except Exception:
         pass
-    return app_name, window_title
-
-def classify_support(app):
-    if not app:
-        return "unknown"
-    app_l = app.lower()
-    if app_l in ["safari", "google chrome", "arc", "firefox", "microsoft edge"]:
-        return "internet research"
-    elif app_l in ["notes", "notion", "obsidian", "bear"]:
-        return "note app"
-    else:
-        return app_l
+    _refresh_active()
+
+def start_app_window_watch():
+    """Subscribe to app activation and focus/title changes. Returns False if unavailable."""
+    if not NSWorkspace or AXObserverCreate is None:
+        return False
+    try:
+        workspace = NSWorkspace.sharedWorkspace()
+        _AX_STATE['token'] = workspace.notificationCenter().addObserverForName_object_queue_usingBlock_(
+            NSWorkspaceDidActivateApplicationNotification, None, None, _on_app_activated
+        )
+        front = workspace.frontmostApplication()
+        if front:
+            _observe_app(front.processIdentifier())
+    except Exception:
+        return False
+    _refresh_active()
+    _ACTIVE['watching'] = True
+    return True
+
+def current_app_window():
+    """O(1) read of the pushed app/window, falling back to the TTL-cached poll."""
+    if _ACTIVE['watching']:
+        return _ACTIVE['app'], _ACTIVE['win']
+    return cached_active_app_window()
+
+def dumps_line(event):
+    """Serialize one event as a newline-terminated UTF-8 JSONL record."""
+    if orjson:
+        return orjson.dumps(event) + b'\n'
+    return (json.dumps(event) + '\n').encode('utf-8')
 
 if len(sys.argv) < 2:
-    print("Usage: python capture_worker.py <output_file.jsonl>")
+    print("Usage: python capture_worker.py <output_file.jsonl | ->", file=sys.stderr)
     sys.exit(1)
 
 output_path = sys.argv[1]
 events = []
-running = True
+# Set by stop_all; the main thread and writer block on it instead of polling
+STOP = threading.Event()
+# Keep one unbuffered handle open for the whole session: one write() per batch, no reopen.
+# "-" streams straight to the parent over the stdout pipe.
+if output_path == '-':
+    OUT_FP = open(sys.stdout.fileno(), 'wb', buffering=0, closefd=False)
+else:
+    OUT_FP = open(output_path, 'ab', buffering=0)
+# Listener callbacks only enqueue; a writer thread batches the queue into one write()
+WRITE_INTERVAL = 0.005
+# Wake the writer early once this many events are queued (fast typing / scrolling)
+WRITE_BATCH = 64
+_QUEUE = collections.deque()
+_WRITE_LOCK = threading.Lock()
+_WAKE = threading.Event()
+
+def _iov_max():
+    # writev() accepts at most IOV_MAX buffers per call (1024 on macOS and Linux)
+    try:
+        n = os.sysconf('SC_IOV_MAX')
+    except (ValueError, OSError):
+        return 1024
+    return n if n > 0 else 1024
+
+WRITEV_MAX = _iov_max() if hasattr(os, 'writev') else 0
+
+def _write_lines(lines):
+    # Gather-write the per-event buffers without joining them first
+    if not WRITEV_MAX:
+        OUT_FP.write(b''.join(lines))
+        return
+    fd = OUT_FP.fileno()
+    for i in range(0, len(lines), WRITEV_MAX):
+        chunk = lines[i:i + WRITEV_MAX]
+        written = os.writev(fd, chunk)
+        total = sum(map(len, chunk))
+        if written < total:
+            # Short write (e.g. a full pipe): finish the rest, however many writes it takes
+            rest = memoryview(b''.join(chunk))
+            while written < total:
+                written += os.write(fd, rest[written:])
+
+# Consecutive same-direction scrolls at one spot merge into one event; flushed after this idle gap
+SCROLL_COALESCE_NS = 200_000_000
+_SCROLL = {'event': None, 'last_ns': 0}
+
+def _sign(v):
+    return (v > 0) - (v < 0)
+
+def _same_scroll(a, b):
+    return (
+        a['x'] == b['x'] and a['y'] == b['y']
+        and a.get('app') == b.get('app') and a.get('window') == b.get('window')
+        and _sign(a['dx']) == _sign(b['dx']) and _sign(a['dy']) == _sign(b['dy'])
+    )
+
+def drain_queue(final=False):
+    """Serialize every queued event and append them to OUT_FP in one gathered write."""
+    with _WRITE_LOCK:
+        lines = []
+        pending = _SCROLL['event']
+        while _QUEUE:
+            event = _QUEUE.popleft()
+            if event['type'] == 'mouse_scroll':
+                if pending and _same_scroll(pending, event):
+                    pending['dx'] += event['dx']
+                    pending['dy'] += event['dy']
+                else:
+                    if pending:
+                        lines.append(dumps_line(pending))
+                    pending = event
+                _SCROLL['last_ns'] = event['ts_ns']
+                continue
+            if pending:
+                lines.append(dumps_line(pending))
+                pending = None
+            lines.append(dumps_line(event))
+        if pending and (final or time_ns() - _SCROLL['last_ns'] > SCROLL_COALESCE_NS):
+            lines.append(dumps_line(pending))
+            pending = None
+        _SCROLL['event'] = pending
+        if lines:
+            _write_lines(lines)
+
+def writer_loop():
+    while not STOP.is_set():
+        if not _QUEUE and _SCROLL['event'] is None:
+            # Idle: sleep until record_event queues the first event (or stop_all)
+            _WAKE.wait()
+        elif not _QUEUE:
+            # Only a coalesced scroll is held back: wake when its idle gap runs out
+            _WAKE.wait(max(0, _SCROLL['last_ns'] + SCROLL_COALESCE_NS - time_ns()) / 1e9)
+        _WAKE.clear()
+        # Let a burst batch up; WRITE_BATCH queued events cut the wait short
+        if _QUEUE and len(_QUEUE) < WRITE_BATCH:
+            _WAKE.wait(WRITE_INTERVAL)
+            _WAKE.clear()
+        drain_queue()
 
 def record_event(event):
     # Enrich event with app/window/support at capture time
-    app, win = get_active_app_window()
+    app, win = current_app_window()
     if app:
         event['app'] = app
     if win:
         event['window'] = win
     event['support'] = classify_support(app)
-    with open(output_path, 'a', encoding='utf-8') as f:
-        f.write(json.dumps(event) + '\n')
+    was_empty = not _QUEUE
+    _QUEUE.append(event)
+    if was_empty or len(_QUEUE) >= WRITE_BATCH:
+        _WAKE.set()
+
+# Precomputed enum -> str for the hot listener callbacks (str(Enum) is slow)
+_BUTTON_STR = {b: str(b) for b in mouse.Button}
+_KEY_STR = {k: str(k) for k in keyboard.Key}
+
+def key_str(key):
+    # Printable keys carry .char; special keys keep their 'Key.x' form
+    if isinstance(key, keyboard.KeyCode):
+        return key.char
+    return _KEY_STR.get(key) or str(key)
 
 def on_click(x, y, button, pressed):
     record_event({
         'type': 'mouse_click',
         'x': x,
         'y': y,
-        'button': str(button),
+        'button': _BUTTON_STR.get(button) or str(button),
         'pressed': pressed,
-        'timestamp': datetime.datetime.now().isoformat()
+        'ts_ns': time_ns()
     })
 
 def on_scroll(x, y, dx, dy):
@@ -79,54 +242,62 @@ def on_scroll(x, y, dx, dy):
         'y': y,
         'dx': dx,
         'dy': dy,
-        'timestamp': datetime.datetime.now().isoformat()
+        'ts_ns': time_ns()
     })
 
 def on_press(key):
-    try:
-        k = key.char
-    except AttributeError:
-        k = str(key)
+    k = key_str(key)
     record_event({
         'type': 'key_press',
         'key': k,
-        'timestamp': datetime.datetime.now().isoformat()
+        'ts_ns': time_ns()
     })
 
 def on_release(key):
-    try:
-        k = key.char
-    except AttributeError:
-        k = str(key)
+    k = key_str(key)
     record_event({
         'type': 'key_release',
         'key': k,
-        'timestamp': datetime.datetime.now().isoformat()
+        'ts_ns': time_ns()
     })
 
 def stop_all(signum, frame):
-    global running
-    running = False
-    print("[CaptureWorker] Stopping event capture.")
-    sys.exit(0)
+    print("[CaptureWorker] Stopping event capture.", file=sys.stderr)
+    STOP.set()
+    _WAKE.set()
 
 signal.signal(signal.SIGINT, stop_all)
 signal.signal(signal.SIGTERM, stop_all)
 
-print(f"[CaptureWorker] Writing events to {output_path}")
+print(f"[CaptureWorker] Writing events to {'stdout' if output_path == '-' else output_path}", file=sys.stderr)
 
 mouse_listener = mouse.Listener(on_click=on_click, on_scroll=on_scroll)
 keyboard_listener = keyboard.Listener(on_press=on_press, on_release=on_release)
+mouse_listener.daemon = True
+keyboard_listener.daemon = True
+writer_thread = threading.Thread(target=writer_loop, daemon=True)
+writer_thread.start()
 mouse_listener.start()
 keyboard_listener.start()
+watching = start_app_window_watch()
+
+# Seconds per main run loop slice; Python signal handlers only run between slices
+RUNLOOP_SLICE = 0.5
 
 try:
-    while running:
-        mouse_listener.join(0.1)
-        keyboard_listener.join(0.1)
+    if watching:
+        # Service workspace/AX callbacks until a signal sets STOP
+        while not STOP.is_set():
+            # A run loop with no sources returns at once instead of waiting out the slice
+            if CFRunLoopRunInMode(kCFRunLoopDefaultMode, RUNLOOP_SLICE, False) == kCFRunLoopRunFinished:
+                STOP.wait(RUNLOOP_SLICE)
+    else:
+        STOP.wait()
 except KeyboardInterrupt:
     stop_all(None, None)
 finally:
     mouse_listener.stop()
     keyboard_listener.stop()
-    print("[CaptureWorker] Done.")
+    drain_queue(final=True)
+    OUT_FP.close()
+    print("[CaptureWorker] Done.", file=sys.stderr)
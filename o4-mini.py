@@ -11,9 +11,16 @@ Revision history
 from __future__ import annotations
 
 from dotenv import load_dotenv
-import os, re, sys, subprocess, tempfile, datetime, pathlib, objc, json
+import os, re, sys, subprocess, datetime, pathlib, objc, json, asyncio, hashlib, fcntl, atexit, threading, time, functools, collections, sqlite3, struct
 import numpy as np
-import openai
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    from rapidfuzz import fuzz, process as fuzz_process, utils as fuzz_utils
+except ImportError:
+    fuzz_process = None
 from typing import List
 from AppKit import (
     NSApplication, NSRunningApplication,
@@ -23,14 +30,23 @@ from AppKit import (
 from PyObjCTools import AppHelper
 import ui
 from Foundation import NSObject, NSLog
-import importlib
-import capture
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY missing – set env var or .env file")
-CLIENT = openai.OpenAI(api_key=OPENAI_API_KEY)
+
+# openai is slow to import; clients are built on first use (warmed on a thread after launch)
+@functools.lru_cache(maxsize=None)
+def _client():
+    import openai
+    return openai.OpenAI(api_key=OPENAI_API_KEY)
+
+@functools.lru_cache(maxsize=None)
+def _async_client():
+    import openai
+    return openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+
 MODEL_ID = "gpt-4o-mini"
 
 SYSTEM_PROMPT = (
@@ -49,60 +65,634 @@ SYSTEM_PROMPT = (
     "9. Always test for permissions and enablement; detect missing Accessibility rights.\n"
 )
 
+# Patterns used on every generation / test / save
+_CODE_RE = re.compile(r"```(?:python)?\s*(.+?)\s*```", re.DOTALL)
+_FENCE_RE = re.compile(r"```(?:applescript)?\s*", re.IGNORECASE)
+_DASH_RUN_RE = re.compile(r"-{2,}")
+
+class _SlugTable(dict):
+    """str.translate table: [a-z0-9] kept, every other code point mapped to '-' (cached on first sight)."""
+    def __missing__(self, cp: int) -> str:
+        self[cp] = ch = chr(cp) if chr(cp) in "abcdefghijklmnopqrstuvwxyz0123456789" else "-"
+        return ch
+
+_SLUG_TABLE = _SlugTable()
+
+def slugify(text: str) -> str:
+    """Filename-safe slug of text, at most 60 chars."""
+    slug = _DASH_RUN_RE.sub("-", text.lower().translate(_SLUG_TABLE)).strip("-")[:60]
+    return slug or "untitled"
+
 ROOT_DIR = pathlib.Path(__file__).resolve().parent
-STORE_PATH = ROOT_DIR / "experiences.jsonl"
-
-def get_embedding(text: str, engine: str = "text-embedding-ada-002") -> list[float]:
-    resp = CLIENT.embeddings.create(model=engine, input=[text])
-    return resp.data[0].embedding  # type: ignore
-
-def distances_from_embeddings(target: list[float], others: list[list[float]]) -> list[float]:
-    t = np.array(target)
-    t_norm = np.linalg.norm(t)
-    res = []
-    for vec in others:
-        v = np.array(vec)
-        norm_v = np.linalg.norm(v)
-        if t_norm == 0 or norm_v == 0:
-            res.append(1.0)
-        else:
-            cos = float(np.dot(t, v) / (t_norm * norm_v))
-            res.append(1.0 - cos)
-    return res
+STORE_PATH = ROOT_DIR / "experiences.jsonl"  # legacy: embeddings inline, migrated on first launch
+META_PATH = ROOT_DIR / "experiences.meta.jsonl"
+EMB_PATH = ROOT_DIR / "experiences.emb.f32"  # L2-normalized float32 rows, row i <-> META_PATH line i
+# Present once every row in EMB_PATH is normalized (older sidecars stored raw embeddings)
+EMB_NORMALIZED_MARK = ROOT_DIR / "experiences.emb.normalized"
+
+# Fixed-size binary records (16-byte key digest + EMBED_DIM float32), appended by every instance;
+# compacted to the newest EMB_CACHE_MAX records when loaded (in warm_up, off the launch path)
+EMB_CACHE_PATH = ROOT_DIR / "emb_cache.f32bin"
+EMB_CACHE_MAX = 4096  # embeddings kept in memory (~6 KB float32 each), least recently used dropped first
+EMB_CACHE: collections.OrderedDict[bytes, np.ndarray] = collections.OrderedDict()
+_EMB_CACHE_LOCK = threading.Lock()  # generation (worker thread) and feedback (main thread) both embed
+
+def _emb_cache_put(key: bytes, emb: np.ndarray) -> None:
+    with _EMB_CACHE_LOCK:
+        EMB_CACHE[key] = emb
+        EMB_CACHE.move_to_end(key)
+        if len(EMB_CACHE) > EMB_CACHE_MAX:
+            EMB_CACHE.popitem(last=False)
+
+def _loads(line: bytes):
+    return orjson.loads(line) if orjson else json.loads(line)
+
+def _dumps_line(obj) -> bytes:
+    """One newline-terminated UTF-8 JSONL record."""
+    if orjson:
+        return orjson.dumps(obj) + b"\n"
+    return (json.dumps(obj) + "\n").encode("utf-8")
+
+def _emb_key(text: str, engine: str) -> bytes:
+    return hashlib.blake2b(f"{engine}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+def _emb_cache_dtype() -> np.dtype:
+    return np.dtype([("key", "V16"), ("emb", "<f4", (EMBED_DIM,))])
+
+def _load_emb_cache() -> None:
+    """Load the newest EMB_CACHE_MAX records, rewriting the file down to them if it has grown past 2x."""
+    dtype = _emb_cache_dtype()
+    with open(EMB_CACHE_PATH, 'r+b') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        data = f.read()
+        n = len(data) // dtype.itemsize  # a torn trailing record from a crashed writer is ignored
+        recs = np.frombuffer(data, dtype=dtype, count=n)[-EMB_CACHE_MAX:]
+        if n > 2 * EMB_CACHE_MAX or len(data) != n * dtype.itemsize:
+            # Rewrite in place (not rename): other instances' O_APPEND handles stay on this file
+            f.seek(0)
+            f.truncate()
+            f.write(recs.tobytes())
+    loaded = [(rec["key"].tobytes(), rec["emb"].copy()) for rec in recs]
+    with _EMB_CACHE_LOCK:
+        # Entries embedded since launch are newer than anything on disk: the disk records go in
+        # at the least-recent end, so trimming to EMB_CACHE_MAX drops them first
+        live = list(EMB_CACHE.items())
+        EMB_CACHE.clear()
+        EMB_CACHE.update(loaded)
+        for key, emb in live:
+            EMB_CACHE[key] = emb
+            EMB_CACHE.move_to_end(key)
+        while len(EMB_CACHE) > EMB_CACHE_MAX:
+            EMB_CACHE.popitem(last=False)
+
+def get_embedding(text: str, engine: str = "text-embedding-ada-002") -> np.ndarray:
+    """Embed text, reusing the content-hash cache shared with other processes via EMB_CACHE_PATH."""
+    key = _emb_key(text, engine)
+    with _EMB_CACHE_LOCK:
+        emb = EMB_CACHE.get(key)
+        if emb is not None:
+            EMB_CACHE.move_to_end(key)
+            return emb
+    resp = _client().embeddings.create(model=engine, input=[text])
+    # float32 array, not the client's list of Python floats (~49 KB each): 8x less resident
+    emb = np.asarray(resp.data[0].embedding, dtype=np.float32)  # type: ignore
+    _emb_cache_put(key, emb)
+    fcntl.flock(EMB_CACHE_FH, fcntl.LOCK_EX)
+    try:
+        EMB_CACHE_FH.write(key + emb.astype("<f4", copy=False).tobytes())
+    finally:
+        fcntl.flock(EMB_CACHE_FH, fcntl.LOCK_UN)
+    return emb
+
+# Opened once like the store handles: unbuffered O_APPEND, one write(2) per new embedding
+EMB_CACHE_FH = open(EMB_CACHE_PATH, 'ab', buffering=0)
+atexit.register(EMB_CACHE_FH.close)
+
+EMBED_BATCH = 2048  # max inputs per embeddings request
+EMBED_CONCURRENCY = 5  # max embeddings requests in flight
+
+async def _aget_embeddings(chunks: list[list[str]], engine: str) -> list[list[float]]:
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    async def embed(chunk: list[str]) -> list[list[float]]:
+        async with sem:
+            resp = await _async_client().embeddings.create(model=engine, input=chunk)
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+    results = await asyncio.gather(*(embed(c) for c in chunks))
+    return [emb for chunk in results for emb in chunk]
+
+def get_embeddings(texts: list[str], engine: str = "text-embedding-ada-002") -> list[list[float]]:
+    """Embed many texts, one request per EMBED_BATCH inputs, requests issued concurrently."""
+    chunks = [texts[i:i + EMBED_BATCH] for i in range(0, len(texts), EMBED_BATCH)]
+    if not chunks:
+        return []
+    if len(chunks) == 1:
+        # A single request doesn't need an event loop
+        resp = _client().embeddings.create(model=engine, input=chunks[0])
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+    return asyncio.run(_aget_embeddings(chunks, engine))
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    """L2-normalize rows (all-zero rows stay zero)."""
+    # einsum row dot-products skip np.linalg.norm's dispatch overhead (dominant for 1-D queries)
+    norms = np.sqrt(np.einsum('...i,...i->...', mat, mat))[..., None]
+    return mat / np.where(norms == 0, 1.0, norms)
+
+# Max in-memory successes, and separately failures (_evict); no retrieval matrix is taller, so
+# the size thresholds of the faster search paths below are derived from it
+STORE_CAP = int(os.getenv("STORE_CAP", "5000"))
+# Stores at least this tall go through the threaded Numba kernel; below it thread start-up dominates
+NUMBA_MIN_ROWS = min(2048, STORE_CAP // 2)
+# In-memory dtype of the retrieval matrices. float16 halves RAM and bytes streamed per query;
+# NumPy has no float16 BLAS, so those rows are upcast block by block (cache-sized) before the dot.
+EMB_DTYPE = np.dtype(os.getenv("EMB_DTYPE", "float32"))
+if EMB_DTYPE not in (np.float32, np.float16):
+    raise RuntimeError(f"EMB_DTYPE must be float32 or float16, not {EMB_DTYPE}")
+F16_BLOCK = 2048  # rows upcast per step (~12 MB float32 scratch)
+
+# Optional and slow to import (pulls in llvmlite): loaded on the first query against a large store
+numba = None
+
+def _cos_dist_loop(mat, t):
+    out = np.empty(mat.shape[0], np.float32)
+    for i in numba.prange(mat.shape[0]):
+        s = np.float32(0.0)
+        for j in range(mat.shape[1]):
+            s += mat[i, j] * t[j]
+        out[i] = 1.0 - s
+    return out
+
+@functools.lru_cache(maxsize=None)
+def _cos_dist_kernel():
+    """_cos_dist_loop compiled with Numba (threaded over rows), or None if numba is missing."""
+    global numba
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba.njit(parallel=True, fastmath=True, cache=True)(_cos_dist_loop)
+
+_NUMBA_LOCK = threading.Lock()
+
+def distances_from_embeddings(target: list[float], mat: np.ndarray) -> np.ndarray:
+    """Cosine distance from target to every row of the row-normalized mat: 1 - dot."""
+    t = _normalize(np.asarray(target, dtype=np.float32)).astype(np.float32, copy=False)
+    if mat.dtype == np.float16:
+        out = np.empty(len(mat), dtype=np.float32)
+        for i in range(0, len(mat), F16_BLOCK):
+            out[i:i + F16_BLOCK] = mat[i:i + F16_BLOCK].astype(np.float32) @ t
+        return 1.0 - out
+    kernel = _cos_dist_kernel() if len(mat) >= NUMBA_MIN_ROWS else None
+    # Numba's default workqueue threading layer aborts the process on concurrent parallel calls;
+    # a second generation thread takes the BLAS matvec instead of waiting
+    if kernel is not None and _NUMBA_LOCK.acquire(blocking=False):
+        try:
+            return kernel(np.ascontiguousarray(mat), t)
+        finally:
+            _NUMBA_LOCK.release()
+    return 1.0 - mat @ t
+
+def top_k_idx(dists: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k smallest distances, nearest first, selected in O(N) with argpartition."""
+    if len(dists) > k:
+        idx = np.argpartition(dists, k - 1)[:k]
+    else:
+        idx = np.arange(len(dists))
+    return idx[np.argsort(dists[idx])]
+
+# Stores at least this tall are searched through a FAISS HNSW graph (optional dependency);
+# below it the exact scan is cheap. Kept under STORE_CAP's 90% post-eviction size so it is reachable.
+HNSW_MIN_ROWS = min(4096, STORE_CAP * 3 // 4)
+HNSW_M = 32  # graph neighbours per node
+# Per matrix ("succ"/"fail"): (HNSW index over its leading rows, buffer those rows live in).
+# Appends are added on the next search; eviction reorders rows into a new buffer, so a search
+# over a different buffer rebuilds.
+_HNSW: dict[str, tuple] = {}
+# run_ and submit_ can search concurrently; FAISS can't search an index while it is added to,
+# so the build/add and the search both happen under this lock
+_HNSW_LOCK = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def _faiss():
+    try:
+        import faiss
+    except ImportError:
+        return None
+    return faiss
+
+def _hnsw_index(mat: np.ndarray, kind: str):
+    # Caller holds _HNSW_LOCK
+    faiss = _faiss()
+    if faiss is None:
+        return None
+    owner = mat.base if mat.base is not None else mat
+    entry = _HNSW.get(kind)
+    if entry is None or entry[1] is not owner:
+        index = faiss.IndexHNSWFlat(mat.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 128
+        index.hnsw.efSearch = 64
+        _HNSW[kind] = (index, owner)
+    else:
+        index = entry[0]
+    if index.ntotal < len(mat):
+        index.add(np.ascontiguousarray(mat[index.ntotal:], dtype=np.float32))
+    return index
+
+def nearest_exact(target: list[float], mat: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    dists = distances_from_embeddings(target, mat)
+    idx = top_k_idx(dists, k)
+    return idx, dists[idx]
+
+def nearest(target: list[float], mat: np.ndarray, k: int, kind: str) -> tuple[np.ndarray, np.ndarray]:
+    """(indices, cosine distances) of the k rows of mat nearest target, nearest first."""
+    if len(mat) < HNSW_MIN_ROWS or _faiss() is None:
+        return nearest_exact(target, mat, k)
+    t = _normalize(np.asarray(target, dtype=np.float32)).astype(np.float32, copy=False)
+    with _HNSW_LOCK:
+        sims, idx = _hnsw_index(mat, kind).search(t[None, :], k)
+    # A concurrent search may have indexed rows appended after this caller's snapshot of mat;
+    # the exact scan over mat itself is the answer then
+    if ((idx[0] < 0) | (idx[0] >= len(mat))).any():
+        return nearest_exact(target, mat, k)
+    return idx[0], 1.0 - sims[0]
 
 (ROOT_DIR / "success").mkdir(exist_ok=True)
 (ROOT_DIR / "fail").mkdir(exist_ok=True)
 
-successes: List[dict] = []
-failures: List[dict] = []
-if STORE_PATH.exists():
-    with open(STORE_PATH, 'r', encoding='utf-8') as f:
-        for line in f:
-            rec = json.loads(line)
-            if rec.get("reward") == 1:
-                successes.append(rec)
-            else:
-                failures.append(rec)
-
-for rec in successes + failures:
-    if "embedding" not in rec:
-        rec["embedding"] = get_embedding(rec["prompt"])
+EMBED_DIM = 1536  # text-embedding-ada-002
+ROW_BYTES = EMBED_DIM * 4
+
+def _migrate_legacy_store() -> None:
+    """One-shot split of the old experiences.jsonl (embeddings inline) into meta + float32 sidecar."""
+    with open(STORE_PATH, 'rb') as f:
+        legacy = [_loads(line) for line in f if line.strip()]
+    emb = np.full((len(legacy), EMBED_DIM), np.nan, dtype=np.float32)
+    for i, rec in enumerate(legacy):
+        if rec.get("embedding"):
+            emb[i] = rec["embedding"]
+    with open(EMB_PATH, 'wb') as f:
+        f.write(emb.tobytes())
+    with open(META_PATH, 'wb') as f:
+        f.writelines(_dumps_line({k: v for k, v in r.items() if k != "embedding"}) for r in legacy)
+
+def _load_store() -> tuple[List[dict], np.ndarray, np.ndarray]:
+    """Read meta records and their (N, EMBED_DIM) embedding rows, repairing the sidecar.
+    Also returns the indices of rows still lacking an embedding (NaN), for _backfill."""
+    if not META_PATH.exists() and STORE_PATH.exists():
+        _migrate_legacy_store()
+    # Same lock as append_store: another instance can't append a row + meta line between our
+    # read of the meta and the size check, which would make its row look like an orphan
+    with open(META_PATH, 'a+b') as meta:
+        fcntl.flock(meta, fcntl.LOCK_EX)
+        meta.seek(0)
+        records: List[dict] = [_loads(line) for line in meta if line.strip()]
+        n = len(records)
+        # Row i <-> meta line i. Rows past the meta (append interrupted) are dropped; missing rows
+        # are padded as NaN (saved without an embedding) and backfilled in place after launch.
+        size = EMB_PATH.stat().st_size if EMB_PATH.exists() else 0
+        if size != n * ROW_BYTES:
+            keep = min(size // ROW_BYTES, n)
+            with open(EMB_PATH, 'ab') as f:
+                f.truncate(keep * ROW_BYTES)
+                f.write(np.full((n - keep, EMBED_DIM), np.nan, dtype=np.float32).tobytes())
+    if not n:
+        EMB_NORMALIZED_MARK.touch()
+        return records, np.empty((0, EMBED_DIM), dtype=np.float32), np.empty(0, dtype=np.intp)
+    emb = np.memmap(EMB_PATH, dtype=np.float32, mode='r', shape=(n, EMBED_DIM))
+    missing = np.flatnonzero(np.isnan(emb[:, 0]))
+    if not EMB_NORMALIZED_MARK.exists():
+        # One-time upgrade of a raw sidecar; normalizing is idempotent, so a racing instance is harmless
+        emb = np.memmap(EMB_PATH, dtype=np.float32, mode='r+', shape=(n, EMBED_DIM))
+        emb[:] = _normalize(emb)
+        emb.flush()
+        EMB_NORMALIZED_MARK.touch()
+    if len(missing):
+        # Zero rows until backfilled: distance 1.0, never picked over a real neighbour
+        emb = np.array(emb)
+        emb[missing] = 0.0
+    return records, emb, missing
+
+records, EMB_ROWS, _missing = _load_store()
+# (sidecar row, record) pairs to embed after launch; records are matched by identity, as
+# eviction may reorder the in-memory lists before the backfill lands
+_PENDING_BACKFILL = [(int(i), records[i]) for i in _missing]
+successes: List[dict] = [r for r in records if r.get("reward") == 1]
+failures: List[dict] = [r for r in records if r.get("reward") != 1]
+
+# One append handle per file for the app's lifetime. Unbuffered + O_APPEND: each record is a
+# single write(2); the flock keeps a row and its meta line paired across concurrent instances.
+EMB_FH = open(EMB_PATH, 'ab', buffering=0)
+STORE_FH = open(META_PATH, 'ab', buffering=0)
+atexit.register(EMB_FH.close)
+atexit.register(STORE_FH.close)
+
+def append_store(rec: dict) -> None:
+    """Persist rec: its embedding (NaN row if absent, backfilled next launch) + its meta line."""
+    emb = rec.get("embedding")
+    row = _normalize(np.asarray(emb, dtype=np.float32)) if emb is not None and len(emb) else np.full(EMBED_DIM, np.nan, dtype=np.float32)
+    meta = {k: v for k, v in rec.items() if k != "embedding"}
+    fcntl.flock(STORE_FH, fcntl.LOCK_EX)
+    try:
+        # Embedding first: a crash in between leaves an orphan row, which the loader drops
+        EMB_FH.write(row.tobytes())
+        STORE_FH.write(_dumps_line(meta))
+    finally:
+        fcntl.flock(STORE_FH, fcntl.LOCK_UN)
+
+# Stacked, L2-normalized float32 embeddings (row i <-> successes[i] / failures[i]); cosine is a
+# plain dot. Rows are stored normalized, so loading is just a copy. Records carry no embedding.
+def _class_rows(mask: np.ndarray) -> np.ndarray:
+    # Every row in this class: query the mapped sidecar pages in place (page cache, no RAM copy)
+    if mask.all() and EMB_ROWS.dtype == EMB_DTYPE:
+        return EMB_ROWS.view(np.ndarray)
+    return np.asarray(EMB_ROWS[mask], dtype=EMB_DTYPE)
+
+_succ_mask = np.array([r.get("reward") == 1 for r in records], dtype=bool)
+SUCC_MAT = _class_rows(_succ_mask)
+FAIL_MAT = _class_rows(~_succ_mask)
+del records, EMB_ROWS, _succ_mask, _missing
+
+# Retrieval stats per record (hits, last use), kept beside the append-only meta file
+STATS_PATH = ROOT_DIR / "experiences.stats.json"
+STORE_HALF_LIFE = 30 * 86400  # seconds for a record's recency bonus to halve
+
+def _rec_key(rec: dict) -> str:
+    return hashlib.blake2b(f"{rec['prompt']}\0{rec.get('timestamp', '')}".encode("utf-8"), digest_size=16).hexdigest()
+
+def _load_stats() -> dict[str, list[float]]:
+    try:
+        return json.loads(STATS_PATH.read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+REC_STATS = _load_stats()  # rec key -> [hits, last used (epoch seconds)]
+
+def _save_stats() -> None:
+    tmp = STATS_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(REC_STATS), encoding="utf-8")
+    os.replace(tmp, STATS_PATH)
+
+atexit.register(_save_stats)
+
+def touch(recs: List[dict]) -> None:
+    """Count a retrieval of each record (frequency + recency for eviction)."""
+    now = time.time()
+    for rec in recs:
+        stats = REC_STATS.setdefault(_rec_key(rec), [0, now])
+        stats[0] += 1
+        stats[1] = now
+
+def _retention_score(rec: dict, now: float) -> float:
+    # PGDSF-style: frequency per unit size, plus a recency bonus that decays with age
+    stats = REC_STATS.get(_rec_key(rec))
+    if stats:
+        hits, last = stats
+    else:
+        try:
+            hits, last = 0, datetime.datetime.fromisoformat(rec["timestamp"]).timestamp()
+        except (KeyError, ValueError):
+            hits, last = 0, 0.0
+    size = 1.0 + len(rec.get("code", "")) / 1000
+    return (1 + hits) / size + 0.5 ** ((now - last) / STORE_HALF_LIFE)
+
+def _evict(recs: List[dict], mat: np.ndarray) -> tuple[List[dict], np.ndarray]:
+    """Over STORE_CAP, keep the best-scoring 90% (headroom so appends don't evict every time)."""
+    if len(recs) <= STORE_CAP:
+        return recs, mat
+    now = time.time()
+    scores = np.array([_retention_score(r, now) for r in recs])
+    target = STORE_CAP * 9 // 10
+    keep = np.sort(np.argpartition(-scores, target - 1)[:target])
+    NSLog(f"[Store] Evicted {len(recs) - target} of {len(recs)} records from memory")
+    return [recs[i] for i in keep], mat[keep]
+
+successes, SUCC_MAT = _evict(successes, SUCC_MAT)
+failures, FAIL_MAT = _evict(failures, FAIL_MAT)
 
-def generate_python_code(prompt: str) -> str:
-    prompt_emb = get_embedding(prompt)
-    succ_embs = [r["embedding"] for r in successes]
-    succ_dists = distances_from_embeddings(prompt_emb, succ_embs)
-    top_succ = sorted(zip(succ_dists, successes), key=lambda x: x[0])[:3]
-    fail_embs = [r["embedding"] for r in failures]
-    fail_dists = distances_from_embeddings(prompt_emb, fail_embs)
-    top_fail = sorted(zip(fail_dists, failures), key=lambda x: x[0])[:2]
+class GrowableMatrix:
+    """Row-append matrix over a buffer whose capacity doubles when full (amortized O(1) add)."""
+
+    def __init__(self, rows: np.ndarray):
+        self._buf = rows
+        self.n = len(rows)
+
+    def add(self, row: np.ndarray) -> None:
+        if self.n == len(self._buf):
+            grown = np.empty((max(64, 2 * self.n), self._buf.shape[1]), dtype=self._buf.dtype)
+            grown[:self.n] = self._buf[:self.n]
+            self._buf = grown
+        # Written past the published view, so readers never see a partial row
+        self._buf[self.n] = row
+        self.n += 1
+
+    def view(self) -> np.ndarray:
+        return self._buf[:self.n]
+
+    def set(self, i: int, row: np.ndarray) -> None:
+        self._buf[i] = row
+
+# Backing storage with spare capacity; SUCC_MAT/FAIL_MAT are views of their used rows
+SUCC_ROWS, FAIL_ROWS = GrowableMatrix(SUCC_MAT), GrowableMatrix(FAIL_MAT)
+
+# Held while the store globals are rebound, so store_snapshot() never pairs a list with the
+# other generation's matrix
+_STORE_LOCK = threading.Lock()
+
+def store_snapshot() -> tuple[List[dict], np.ndarray, List[dict], np.ndarray]:
+    """(successes, SUCC_MAT, failures, FAIL_MAT) as one consistent set, for worker threads:
+    row i of each matrix belongs to entry i of its list, whatever add_experience does later."""
+    with _STORE_LOCK:
+        return list(successes), SUCC_MAT, list(failures), FAIL_MAT
+
+def add_experience(rec: dict) -> None:
+    """Append a scored record to the in-memory store, keeping the matrices in sync."""
+    # Normalized once here; queries never recompute norms for stored rows
+    row = _normalize(np.asarray(rec["embedding"], dtype=np.float32))
+    rec = {k: v for k, v in rec.items() if k != "embedding"}
+    with _STORE_LOCK:
+        _add_experience(rec, row)
+
+def _add_experience(rec: dict, row: np.ndarray) -> None:
+    global SUCC_MAT, FAIL_MAT, SUCC_ROWS, FAIL_ROWS, successes, failures
+    if rec.get("reward") == 1:
+        SUCC_ROWS.add(row)
+        successes.append(rec)
+        view = SUCC_ROWS.view()
+        successes, SUCC_MAT = _evict(successes, view)
+        if SUCC_MAT is not view:
+            SUCC_ROWS = GrowableMatrix(SUCC_MAT)
+    else:
+        FAIL_ROWS.add(row)
+        failures.append(rec)
+        view = FAIL_ROWS.view()
+        failures, FAIL_MAT = _evict(failures, view)
+        if FAIL_MAT is not view:
+            FAIL_ROWS = GrowableMatrix(FAIL_MAT)
+
+def _apply_backfill(recs: List[dict], rows: np.ndarray) -> None:
+    # Main thread, like add_experience: drop the embeddings into the live matrices
+    with _STORE_LOCK:
+        for records, mat in ((successes, SUCC_ROWS), (failures, FAIL_ROWS)):
+            pos = {id(r): i for i, r in enumerate(records)}
+            for rec, row in zip(recs, rows):
+                i = pos.get(id(rec))
+                if i is not None and i < mat.n:
+                    mat.set(i, row)
+        _HNSW.clear()  # indexed the zero placeholders
+
+def _backfill() -> None:
+    """Embed the records saved without one (batched), write their sidecar rows, patch memory."""
+    pending = _PENDING_BACKFILL[:]
+    if not pending:
+        return
+    NSLog(f"[Store] Backfilling {len(pending)} missing embeddings")
+    prompts = [r["prompt"] for _, r in pending]
+    # Each distinct prompt once; ones already in the embedding cache cost no request at all
+    embs = {p: EMB_CACHE.get(_emb_key(p, "text-embedding-ada-002")) for p in dict.fromkeys(prompts)}
+    todo = [p for p, e in embs.items() if e is None]
+    embs.update(zip(todo, get_embeddings(todo)))
+    rows = _normalize(np.asarray([embs[p] for p in prompts], dtype=np.float32))
+    emb = np.memmap(EMB_PATH, dtype=np.float32, mode='r+', shape=(max(i for i, _ in pending) + 1, EMBED_DIM))
+    emb[[i for i, _ in pending]] = rows
+    emb.flush()
+    del emb
+    _PENDING_BACKFILL.clear()
+    AppHelper.callAfter(_apply_backfill, [r for _, r in pending], rows)
+
+def warm_up() -> None:
+    """Run after launch on a worker thread: load the embedding cache, import openai / build the
+    client, then backfill."""
+    try:
+        _load_emb_cache()
+        _client()
+        _backfill()
+    except Exception as exc:
+        NSLog(f"[ERROR] Warm-up failed: {exc!r}")
+
+# Exact-prompt cache of generated code (sha256 of the prompt), shared across launches. Dropped
+# when the script fails or gets a thumbs-down.
+CODE_CACHE_PATH = ROOT_DIR / "code_cache.sqlite"
+CODE_CACHE_TTL = 7 * 86400  # seconds
+_CODE_DB = sqlite3.connect(CODE_CACHE_PATH, check_same_thread=False, isolation_level=None)
+_CODE_DB.execute("CREATE TABLE IF NOT EXISTS cache (prompt_hash BLOB PRIMARY KEY, code TEXT, ts REAL)")
+# Expired rows are skipped by cached_code; drop them here so the file doesn't grow forever
+_CODE_DB.execute("DELETE FROM cache WHERE ts <= ?", (time.time() - CODE_CACHE_TTL,))
+# Prompts whose script failed or got a thumbs-down: not answered from the semantic cache for
+# CODE_CACHE_TTL, or until a run of theirs succeeds or gets a thumbs-up
+if "ts" not in {c[1] for c in _CODE_DB.execute("PRAGMA table_info(sem_block)")}:
+    _CODE_DB.execute("DROP TABLE IF EXISTS sem_block")  # pre-expiry layout
+_CODE_DB.execute("CREATE TABLE IF NOT EXISTS sem_block (prompt_hash BLOB PRIMARY KEY, ts REAL)")
+_CODE_DB.execute("DELETE FROM sem_block WHERE ts <= ?", (time.time() - CODE_CACHE_TTL,))
+_CODE_DB_LOCK = threading.Lock()  # written from the generation thread, invalidated from the main thread
+atexit.register(_CODE_DB.close)
+
+def _prompt_hash(prompt: str) -> bytes:
+    return hashlib.sha256(prompt.encode("utf-8")).digest()
+
+def cached_code(prompt: str) -> str | None:
+    with _CODE_DB_LOCK:
+        row = _CODE_DB.execute(
+            "SELECT code FROM cache WHERE prompt_hash = ? AND ts > ?",
+            (_prompt_hash(prompt), time.time() - CODE_CACHE_TTL),
+        ).fetchone()
+    return row[0] if row else None
+
+def cache_code(prompt: str, code: str) -> None:
+    with _CODE_DB_LOCK:
+        _CODE_DB.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (_prompt_hash(prompt), code, time.time()))
+
+def invalidate_code(prompt: str) -> None:
+    """Forget prompt's cached code and stop replaying stored successes for it."""
+    key = _prompt_hash(prompt)
+    with _CODE_DB_LOCK:
+        _CODE_DB.execute("DELETE FROM cache WHERE prompt_hash = ?", (key,))
+        _CODE_DB.execute("INSERT OR REPLACE INTO sem_block VALUES (?, ?)", (key, time.time()))
+
+def unblock_code(prompt: str) -> None:
+    """Let the semantic cache answer prompt again after a run of it worked."""
+    with _CODE_DB_LOCK:
+        _CODE_DB.execute("DELETE FROM sem_block WHERE prompt_hash = ?", (_prompt_hash(prompt),))
+
+def _sem_blocked(prompt: str) -> bool:
+    with _CODE_DB_LOCK:
+        return _CODE_DB.execute(
+            "SELECT 1 FROM sem_block WHERE prompt_hash = ? AND ts > ?",
+            (_prompt_hash(prompt), time.time() - CODE_CACHE_TTL),
+        ).fetchone() is not None
+
+# A query this similar (rapidfuzz ratio after lowercasing / dropping punctuation) to a stored
+# success prompt borrows its embedding row instead of calling the embeddings API
+FUZZY_EMB_SCORE = 95
+
+def query_embedding(prompt: str, recs: List[dict], mat: np.ndarray) -> tuple[np.ndarray, bool]:
+    """(embedding, same_text) for a retrieval query against the success records/matrix recs/mat.
+    same_text is False when the embedding came from a merely similar prompt: good enough for
+    few-shot retrieval, not for a cache hit."""
+    if fuzz_process is not None and recs:
+        match = fuzz_process.extractOne(
+            prompt, [r["prompt"] for r in recs], scorer=fuzz.ratio,
+            processor=fuzz_utils.default_process, score_cutoff=FUZZY_EMB_SCORE,
+        )
+        if match is not None and match[2] < len(mat):
+            return mat[match[2]], match[1] == 100
+    return get_embedding(prompt), True
+
+# Semantic response cache: a success this close (cosine distance) to the new prompt is reused as-is
+SEM_CACHE_ENABLED = os.getenv("SEM_CACHE", "1") != "0"
+SEM_CACHE_THRESH = float(os.getenv("SEM_CACHE_THRESH", "0.02"))
+SEM_CACHE_STATS = {"hits": 0, "misses": 0}
+
+STREAM_PAINT_INTERVAL = 0.05  # min seconds between on_delta calls while streaming
+
+def generate_python_code(prompt: str, on_delta=None) -> str:
+    """Generate a script for prompt. The reply is streamed; on_delta(text_so_far) is called at most
+    every STREAM_PAINT_INTERVAL seconds (the final text is the return value)."""
+    code = cached_code(prompt)
+    if code is not None:
+        NSLog(f"[Cache] Exact prompt hit for: {prompt!r}")
+        return code
+    # Runs off the main thread while add_experience may evict and rebind the store: read it once
+    successes, succ_mat, failures, fail_mat = store_snapshot()
+    # A store no bigger than k is used whole; distances are only needed for the semantic cache
+    search_succ = bool(successes) and (SEM_CACHE_ENABLED or len(successes) > 3)
+    search_fail = len(failures) > 2
+    # No search, no embedding request (cold start, or a store small enough to use whole)
+    prompt_emb, same_text = (
+        query_embedding(prompt, successes, succ_mat) if search_succ or search_fail else (None, True)
+    )
+    if search_succ:
+        # One nearest-neighbour query serves both the cache check and the few-shot examples
+        idx, dists = nearest(prompt_emb, succ_mat, 3, "succ")
+        best = int(idx[0])
+        if (
+            SEM_CACHE_ENABLED and same_text and dists[0] < SEM_CACHE_THRESH
+            and not _sem_blocked(prompt)
+            # A failure at least as close means this kind of request has gone wrong since
+            and not (len(failures) and nearest(prompt_emb, fail_mat, 1, "fail")[1][0] <= dists[0])
+        ):
+            # Near-duplicate of a prompt that already worked: reuse its code, skip the LLM
+            SEM_CACHE_STATS["hits"] += 1
+            touch([successes[best]])
+            NSLog(f"[Cache] Semantic hit (distance {dists[0]:.4f}) for: {successes[best]['prompt']!r} "
+                  f"[{SEM_CACHE_STATS['hits']} hits / {SEM_CACHE_STATS['misses']} misses]")
+            return successes[best]["code"]
+        top_succ = [successes[i] for i in idx]
+    else:
+        top_succ = list(successes)
+    SEM_CACHE_STATS["misses"] += 1
+    if search_fail:
+        top_fail = [failures[i] for i in nearest(prompt_emb, fail_mat, 2, "fail")[0]]
+    else:
+        top_fail = list(failures)
+    touch(top_succ + top_fail)
 
     shots = ""
-    for _, ex in top_succ:
+    for ex in top_succ:
         shots += f"### Good Example\nUser: {ex['prompt']}\nAssistant:\n```python\n{ex['code']}```\n\n"
     if top_fail:
         shots += "### Avoid These Patterns\n"
-        for _, ex in top_fail:
+        for ex in top_fail:
             shots += f"- {ex['prompt']}\n"
         shots += "\n"
 
@@ -110,36 +700,92 @@ def generate_python_code(prompt: str) -> str:
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": shots + f"### New Request\n{prompt}"},
     ]
-    rsp = CLIENT.chat.completions.create(
+    stream = _client().chat.completions.create(
         model=MODEL_ID,
         temperature=0.1,
         max_tokens=1024,
         messages=messages,
+        stream=True,
     )
-    msg = rsp.choices[0].message.content
-    m = re.search(r"```(?:python)?\s*(.+?)\s*```", msg, re.DOTALL)
+    parts: list[str] = []
+    last_paint = 0.0
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            # Join only when a paint is due: joining per token is quadratic in the reply length
+            now = time.monotonic()
+            if on_delta and now - last_paint >= STREAM_PAINT_INTERVAL:
+                last_paint = now
+                on_delta("".join(parts))
+    msg = "".join(parts)
+    m = _CODE_RE.search(msg)
     if not m:
         raise ValueError("Model reply lacked a Python code block:\n" + msg)
+    cache_code(prompt, m.group(1))
     return m.group(1)
 
-def run_code(code_text: str) -> bool:
-    with tempfile.NamedTemporaryFile("w+", suffix=".py", delete=False) as tf:
-        tf.write(code_text)
-        tf.flush()
-        tf_path = tf.name
-    NSLog(f"[Runner] Executing {tf_path}")
+# Scripts run in a long-lived interpreter (runner_worker.py) instead of a fresh python per run.
+# PERSISTENT_RUNNER=0 restores one `python -c` per script.
+RUNNER_PATH = ROOT_DIR / "runner_worker.py"
+PERSISTENT_RUNNER = os.getenv("PERSISTENT_RUNNER", "1") != "0"
+_RUNNER = {"proc": None}
+_RUNNER_LOCK = threading.Lock()  # one script at a time in the runner; overlapping runs spawn
+
+def _runner() -> subprocess.Popen:
+    """The runner process, (re)started if it isn't alive."""
+    proc = _RUNNER["proc"]
+    if proc is None or proc.poll() is not None:
+        proc = subprocess.Popen([sys.executable, str(RUNNER_PATH)], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        _RUNNER["proc"] = proc
+    return proc
+
+def _stop_runner() -> None:
+    proc = _RUNNER["proc"]
+    if proc is not None and proc.poll() is None:
+        proc.stdin.close()  # EOF: the runner exits after the current script
+        try:
+            proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def _run_in_runner(code_text: str) -> int:
+    proc = _runner()
+    data = code_text.encode("utf-8")
     try:
-        subprocess.run([sys.executable, tf_path], check=True)
-        return True
-    except subprocess.CalledProcessError as e:
-        NSLog(f"[ERROR] Script failed: {e}")
-        return False
-    finally:
-        os.remove(tf_path)
+        proc.stdin.write(struct.pack("<Q", len(data)) + data)
+        proc.stdin.flush()
+        reply = proc.stdout.read(4)
+    except OSError:
+        reply = b""
+    if len(reply) < 4:
+        # The script took the interpreter down (os._exit, crash); its exit status is the runner's
+        NSLog("[Runner] Interpreter exited; restarting for the next script")
+        return proc.wait()
+    return struct.unpack("<i", reply)[0]
+
+if PERSISTENT_RUNNER:
+    _runner()  # warm it up while the UI starts
+    atexit.register(_stop_runner)
+
+def run_code(code_text: str) -> bool:
+    # Passed as a string (runner pipe or -c), never a temp file: no write/remove round-trip
+    NSLog(f"[Runner] Executing generated script ({len(code_text)} chars)")
+    if PERSISTENT_RUNNER and _RUNNER_LOCK.acquire(blocking=False):
+        try:
+            returncode = _run_in_runner(code_text)
+        finally:
+            _RUNNER_LOCK.release()
+    else:
+        returncode = subprocess.Popen([sys.executable, "-c", code_text]).wait()
+    if returncode:
+        NSLog(f"[ERROR] Script failed with exit status {returncode}")
+    return returncode == 0
 
 class Delegate(NSObject):
     def regenerateCapturedFlow_(self, _):
         # Regenerate AppleScript for the last captured flow
+        import capture
         self._update_status("Regenerating AppleScript for captured flow...")
         applescript = capture.CAPTURE_SESSION.export_applescript()
         self.last_code = applescript
@@ -164,15 +810,39 @@ class Delegate(NSObject):
 
         self.last_prompt = prompt
         self.field.setStringValue_("")
+        # The OpenAI round trip and the script both run off the main thread, as in run_
+        threading.Thread(target=self._generate_and_submit, args=(prompt,), daemon=True).start()
+
+    @objc.python_method
+    def _generate_and_submit(self, prompt: str):
+        # Worker thread: delegate state is only touched via AppHelper.callAfter
         try:
             code = generate_python_code(prompt)
-            self.last_code = code
-            ok = run_code(code)
-            self.last_success = ok
-            NSLog("[Agent] Success" if ok else "[Agent] Failed")
         except Exception as exc:
-            self.last_success = False
             NSLog(f"[ERROR] {exc!r}")
+            AppHelper.callAfter(self._submit_failed)
+            return
+        AppHelper.callAfter(self._set_last_code, code)
+        AppHelper.callAfter(self._submit_finished, prompt, run_code(code))
+
+    @objc.python_method
+    def _set_last_code(self, code: str):
+        self.last_code = code
+
+    @objc.python_method
+    def _submit_failed(self):
+        self.last_success = False
+        NSLog("[Agent] Failed")
+
+    @objc.python_method
+    def _submit_finished(self, prompt: str, ok: bool):
+        # prompt is the one this script was generated for; last_prompt may belong to a newer request
+        self.last_success = ok
+        if ok:
+            unblock_code(prompt)
+        else:
+            invalidate_code(prompt)
+        NSLog("[Agent] Success" if ok else "[Agent] Failed")
 
     def run_(self, _):
         prompt = self.field.stringValue().strip()
@@ -184,32 +854,61 @@ class Delegate(NSObject):
         self._toggle_feedback(False)
         self.code_view.setString_("")
 
+        # Generate on a worker thread so the streamed reply can paint into code_view as it arrives
+        threading.Thread(target=self._generate_and_run, args=(prompt,), daemon=True).start()
+
+    @objc.python_method
+    def _generate_and_run(self, prompt: str):
+        # Worker thread: every UI touch goes through AppHelper.callAfter
+        show = lambda text: AppHelper.callAfter(self.code_view.setString_, text)
         try:
-            code = generate_python_code(prompt)
-            self.last_code = code
-            self.code_view.setString_(code)
-            self._applescript_tag = 'generated'
-            ok = run_code(code)
-            self.last_success = ok
-            self._update_status("✓ Success" if ok else "✗ Failed")
+            code = generate_python_code(prompt, on_delta=show)
         except Exception as exc:
-            self.last_success = False
-            self._update_status(f"✗ Failed: {exc}")
             NSLog(f"[ERROR] {exc!r}")
-        finally:
-            self._toggle_feedback(True)
+            AppHelper.callAfter(self._generation_failed, exc)
+            return
+        AppHelper.callAfter(self._code_ready, code)
+        AppHelper.callAfter(self._run_finished, prompt, run_code(code))
+
+    @objc.python_method
+    def _code_ready(self, code: str):
+        self.last_code = code
+        self.code_view.setString_(code)
+        self._applescript_tag = 'generated'
+        self._update_status("Running…")
+
+    @objc.python_method
+    def _generation_failed(self, exc: Exception):
+        self.last_success = False
+        self._update_status(f"✗ Failed: {exc}")
+        self._toggle_feedback(True)
+
+    @objc.python_method
+    def _run_finished(self, prompt: str, ok: bool):
+        self.last_success = ok
+        if ok:
+            unblock_code(prompt)
+        else:
+            invalidate_code(prompt)
+        self._update_status("✓ Success" if ok else "✗ Failed")
+        self._toggle_feedback(True)
 
     def thumbUp_(self, _):
+        if self.last_prompt:
+            unblock_code(self.last_prompt)
         self._save_feedback(True)
 
     def thumbDown_(self, _):
+        if self.last_prompt:
+            invalidate_code(self.last_prompt)
         self._save_feedback(False)
 
     def exit_(self, _):
         NSApplication.sharedApplication().terminate_(None)
 
     def toggleCapture_(self, sender):
-        # Toggle capture mode on/off
+        # Toggle capture mode on/off (capture pulls in Quartz; imported on first use)
+        import capture
         if not hasattr(self, '_capture_active') or not self._capture_active:
             capture.CAPTURE_SESSION.start()
             self._update_status("Capture mode: Recording all clicks and keys…")
@@ -237,25 +936,21 @@ class Delegate(NSObject):
         if not code:
             self._update_status("No captured code to save.")
             return
-        import datetime, re, json, pathlib, os
-        ROOT_DIR = pathlib.Path(__file__).resolve().parent
-        STORE_PATH = ROOT_DIR / "experiences.jsonl"
         folder = ROOT_DIR / "success"
         ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-        slug = re.sub(r"[^a-z0-9]+", "-", prompt.lower()).strip("-")[:60] or "untitled"
+        slug = slugify(prompt)
         fp = folder / f"{slug}__{ts}.py"
         header = f"# Prompt: {prompt}\n# Outcome: success\n\n"
         fp.write_text(header + code, encoding="utf-8")
         rec = {"prompt": prompt, "code": code, "reward": 1, "timestamp": datetime.datetime.now().isoformat()}
         try:
-            from openai import OpenAI
-            OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-            CLIENT = OpenAI(api_key=OPENAI_API_KEY)
-            rec["embedding"] = CLIENT.embeddings.create(model="text-embedding-ada-002", input=[prompt]).data[0].embedding
+            rec["embedding"] = get_embedding(prompt)
         except Exception:
-            rec["embedding"] = []
-        with open(STORE_PATH, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(rec) + "\n")
+            rec["embedding"] = []  # saved with a NaN row; backfilled on next launch
+        if len(rec["embedding"]):
+            # Retrievable right away, not only after the next launch
+            add_experience(rec)
+        append_store(rec)
         self._update_status("Captured flow saved and will be used for smart cache retrieval.")
         self._show_save_prompt_field(False)
 
@@ -280,8 +975,7 @@ class Delegate(NSObject):
         self._update_status("Loaded AppleScript from smart cache. Click 'Test it' to run.")
 
     def testScript_(self, _):
-        # Save AppleScript to temp file and run it, tagging the source
-        import tempfile, subprocess, re
+        # Pipe AppleScript to osascript on stdin and run it, tagging the source
         code = self.code_view.string()
         # Tag: check if code was just generated or from smart cache
         tag = getattr(self, '_applescript_tag', None)
@@ -293,31 +987,36 @@ class Delegate(NSObject):
             print("[AppleScript EXECUTION] Source: generated")
         print(f"testing initiated [{tag}]")
         # Remove any markdown code block wrappers
-        applescript_code = re.sub(r"```applescript\\s*", "", code, flags=re.IGNORECASE)
-        applescript_code = re.sub(r"```", "", applescript_code)
-        applescript_code = applescript_code.strip()
+        applescript_code = _FENCE_RE.sub("", code).strip()
         print("AppleScript code to be executed:\n" + applescript_code)
-        with tempfile.NamedTemporaryFile("w+", suffix=".applescript", delete=False) as tf:
-            tf.write(applescript_code)
-            tf.flush()
-            tf_path = tf.name
+        self._update_status(f"Running AppleScript [{tag}]…")
+        # osascript can run for as long as the script drives the UI; keep the main thread free
+        threading.Thread(target=self._run_applescript, args=(applescript_code, tag), daemon=True).start()
+
+    @objc.python_method
+    def _run_applescript(self, applescript_code: str, tag: str):
+        # Worker thread: the outcome is applied on the main thread
         try:
-            result = subprocess.run(["osascript", tf_path], capture_output=True, text=True)
-            if result.returncode == 0:
-                self._update_status(f"AppleScript [{tag}] ran successfully. Click 👍 if it worked!")
-            else:
-                self._update_status(f"AppleScript [{tag}] error: {result.stderr.strip()}")
-                self._show_regenerate_button(True)
+            result = subprocess.run(["osascript", "-"], input=applescript_code, capture_output=True, text=True)
         except Exception as e:
-            self._update_status(f"Failed to run AppleScript [{tag}]: {e}")
+            AppHelper.callAfter(self._test_finished, tag, f"Failed to run AppleScript [{tag}]: {e}", False)
+            return
+        if result.returncode == 0:
+            AppHelper.callAfter(self._test_finished, tag, f"AppleScript [{tag}] ran successfully. Click 👍 if it worked!", True)
+        else:
+            AppHelper.callAfter(self._test_finished, tag, f"AppleScript [{tag}] error: {result.stderr.strip()}", False)
+
+    @objc.python_method
+    def _test_finished(self, tag: str, status: str, ok: bool):
+        self._update_status(status)
+        if not ok:
             self._show_regenerate_button(True)
-        finally:
-            os.remove(tf_path)
         self._toggle_feedback(True)
 
     def regenerateScript_(self, _):
         # Regenerate AppleScript with a new prompt for robustness
         print("Regenerating AppleScript for robustness...")
+        import capture
         prompt = self.last_prompt or "[Captured Flow]"
         # Add a hint to the prompt to maximize success
         regen_prompt = prompt + "\n# Regenerate for maximum reliability. Use alternative strategies if needed."
@@ -345,7 +1044,7 @@ class Delegate(NSObject):
             return
         folder = ROOT_DIR / ("success" if success else "fail")
         ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-        slug = re.sub(r"[^a-z0-9]+", "-", self.last_prompt.lower()).strip("-")[:60] or "untitled"
+        slug = slugify(self.last_prompt)
         fp = folder / f"{slug}__{ts}.py"
         header = f"# Prompt: {self.last_prompt}\n# Outcome: {'success' if success else 'fail'}\n\n"
         fp.write_text(header + self.last_code, encoding="utf-8")
@@ -353,9 +1052,8 @@ class Delegate(NSObject):
 
         rec = {"prompt": self.last_prompt, "code": self.last_code, "reward": int(success), "timestamp": datetime.datetime.now().isoformat()}
         rec["embedding"] = get_embedding(rec["prompt"])
-        (successes if success else failures).append(rec)
-        with open(STORE_PATH, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(rec) + "\n")
+        add_experience(rec)
+        append_store(rec)
 
         self._toggle_feedback(False)
 
@@ -365,6 +1063,8 @@ GLOBAL_DELEGATE = Delegate.alloc().init()
 class MiniUIAppDelegate(ui.AppDelegate):
     def applicationDidFinishLaunching_(self, notification):
         super().applicationDidFinishLaunching_(notification)
+        # Window first; the openai import and any embedding backfill happen behind it
+        threading.Thread(target=warm_up, daemon=True).start()
 
         # Connect UI elements to our Delegate
         GLOBAL_DELEGATE.field = self.window.input_field
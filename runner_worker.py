@@ -0,0 +1,59 @@
+"""
+runner_worker.py – Long-lived interpreter that runs generated scripts for o4-mini.py, so a run
+doesn't pay CPython start-up. Reads length-prefixed UTF-8 source on stdin and replies with a
+4-byte exit status on stdout; the scripts' own stdout goes to stderr, their stdin is /dev/null.
+"""
+import sys, os, struct, traceback, builtins
+
+def read_exact(fp, n):
+    buf = b''
+    while len(buf) < n:
+        chunk = fp.read(n - len(buf))
+        if not chunk:
+            return b''
+        buf += chunk
+    return buf
+
+def run(src):
+    """Execute src as __main__ in fresh globals and return its exit status."""
+    try:
+        exec(compile(src, '<agent>', 'exec'), {'__name__': '__main__', '__builtins__': builtins})
+    except SystemExit as exc:
+        if exc.code is None:
+            return 0
+        if isinstance(exc.code, int):
+            return exc.code
+        print(exc.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    return 0
+
+def main():
+    # Keep the protocol on private fds; scripts see stdout -> stderr and an empty stdin
+    proto_in = os.fdopen(os.dup(0), 'rb', buffering=0)
+    proto_out = os.fdopen(os.dup(1), 'wb', buffering=0)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    os.dup2(2, 1)
+    # Same argv a `python -c` script sees; cwd/path/argv are restored after every run
+    sys.argv[:] = ['-c']
+    cwd, path, argv = os.getcwd(), list(sys.path), list(sys.argv)
+    while True:
+        header = read_exact(proto_in, 8)
+        if not header:
+            break
+        (size,) = struct.unpack('<Q', header)
+        status = run(read_exact(proto_in, size).decode('utf-8'))
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.chdir(cwd)
+        sys.path[:] = path
+        sys.argv[:] = argv
+        # Truncated to 8 bits like a real process exit, so sys.exit(2**40) can't break the packing
+        proto_out.write(struct.pack('<i', status & 0xFF))
+
+if __name__ == '__main__':
+    main()
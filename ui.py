@@ -157,11 +157,13 @@ class AppDelegate(NSObject):
     def _install_shortcut(self):
         flags_required = NSEventModifierFlagCommand | NSEventModifierFlagShift
 
+        # One matcher for both monitors; the integer flag test rejects almost every keystroke
+        # before any NSString is built for the character comparison
         def handler(event):
             if (
-                event.type() == NSEventTypeKeyDown
+                (event.modifierFlags() & flags_required) == flags_required
+                and event.type() == NSEventTypeKeyDown
                 and event.charactersIgnoringModifiers().lower() == "c"
-                and (event.modifierFlags() & flags_required) == flags_required
             ):
                 self.toggleWindow()
             return event